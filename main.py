@@ -1,34 +1,42 @@
 # Path: main.py
 
 import os
-import json
 import re
 import time
 import secrets
+import asyncio
+import threading
+from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import Literal
 
 # Load .env and .env.local
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, Request, Response, HTTPException, Depends, status
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, Request, Response, HTTPException, Depends, BackgroundTasks, status
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
+import orjson
+
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 
-from httpx import AsyncClient
-from utils.discord_webhook import send_discord_webhook
+from utils.discord_webhook import send_discord_webhook, close_discord_client
+from utils.ttl_cache import TTLCache, sweep_periodically
 from utils.youtube_utils import (
+    new_youtube_client,
     fetch_video_info,
     fetch_channel_info,
-    fetch_all_comments,
+    iter_comment_pages,
     fetch_top_comments,
     filter_video_info,
     filter_channel_info,
+    metadata_cache,
+    shutdown_sentiment_pool,
 )
 
 # ─── Environment & Configuration ─────────────────────────────────────────────
@@ -46,12 +54,61 @@ if ENVIRONMENT != "production":
 
 SESSION_WINDOW = int(os.getenv("SESSION_WINDOW", "60"))  # seconds
 SESSION_LIMIT  = int(os.getenv("SESSION_LIMIT",  "30"))  # requests per window
+CACHE_SWEEP_INTERVAL = 60  # seconds between expired-entry sweeps
+
+# download filenames: title with unsafe runs collapsed, capped for pathological titles
+_SLUG_RE     = re.compile(r"[^\w\-]+")
+SLUG_MAX_LEN = 128
+DATE_CACHE_TTL = 60  # seconds
+_date_cache  = {"ts": 0, "value": ""}
+_JSON_OPTS   = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
+# the details/top-comments payload has a fixed envelope, so it is written by
+# hand around orjson-encoded leaves; bytes match orjson's OPT_INDENT_2 output
+_ENVELOPE_INDENT = b"\n  "
+_THREAD_INDENT   = b"\n    "
+_THREAD_SEP      = b"," + _THREAD_INDENT
+_COMMENTS_TAIL       = b"\n  ]\n}"
+_COMMENTS_TAIL_EMPTY = b"]\n}"
 
-# in-memory session buckets (use Redis in prod)
-_session_store = {}
+# finished details payloads, keyed by video id + sentiment mode. Bodies over
+# DETAILS_BODY_MAX are streamed without being kept, so the cache holds at most
+# DETAILS_CACHE_MAX * DETAILS_BODY_MAX bytes (128 MiB).
+DETAILS_CACHE_TTL = 300  # seconds
+DETAILS_CACHE_MAX = 128
+DETAILS_BODY_MAX  = 1 << 20  # bytes
+# how long a request waits for a concurrent scrape of the same video to fill
+# the cache before scraping it itself
+DETAILS_LOCK_WAIT = 30  # seconds
+_details_cache = TTLCache(maxsize=DETAILS_CACHE_MAX)
+
+# in-memory session buckets (use Redis in prod): bounded and sharded so idle
+# sessions expire and concurrent requests rarely contend on the same lock
+SESSION_TTL            = SESSION_WINDOW * 4  # idle buckets are dropped after this
+SESSION_MAX            = 100_000
+SESSION_SHARDS         = 16
+SESSION_SWEEP_INTERVAL = 30  # seconds
+_session_shards = [TTLCache(maxsize=SESSION_MAX // SESSION_SHARDS) for _ in range(SESSION_SHARDS)]
+_session_locks  = [threading.Lock() for _ in range(SESSION_SHARDS)]
 
 # ─── FastAPI Setup ────────────────────────────────────────────────────────────
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one pooled client for every request instead of a fresh pool per call
+    app.state.http = new_youtube_client()
+    sweepers = [
+        asyncio.create_task(sweep_periodically(metadata_cache, CACHE_SWEEP_INTERVAL)),
+        asyncio.create_task(sweep_periodically(_details_cache, CACHE_SWEEP_INTERVAL)),
+        asyncio.create_task(_sweep_sessions()),
+    ]
+    yield
+    for task in sweepers:
+        task.cancel()
+    await app.state.http.aclose()
+    await close_discord_client()
+    shutdown_sentiment_pool()
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # 1) CORS: allow GET, OPTIONS for whitelisted origins
 app.add_middleware(
@@ -70,28 +127,48 @@ app.add_middleware(SlowAPIMiddleware)
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 # ─── Helpers ─────────────────────────────────────────────────────────────────
-def _get_session(request: Request, response: Response) -> str:
-    """Create/retrieve an HttpOnly 'anon_session' cookie and reset its bucket."""
+def _session_shard(sid: str):
+    """Return the (cache, lock) pair owning `sid`."""
+    i = hash(sid) % SESSION_SHARDS
+    return _session_shards[i], _session_locks[i]
+
+async def _sweep_sessions():
+    """Drop expired session buckets even when no new sessions are being created."""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        for shard, lock in zip(_session_shards, _session_locks):
+            with lock:
+                shard.expire()
+
+def _get_session(request: Request, response: Response):
+    """Create/retrieve an HttpOnly 'anon_session' cookie and reset its bucket; return (sid, bucket)."""
     sid = request.cookies.get("anon_session")
     now = time.time()
-    bucket = _session_store.get(sid)
-
-    if not sid or not bucket:
-        sid = secrets.token_urlsafe(32)
-        _session_store[sid] = {"count": 0, "ts": now}
-        response.set_cookie(
-            "anon_session", sid,
-            httponly=True,
-            secure=(ENVIRONMENT == "production"),
-            samesite="lax",
-            max_age=31536000,
-        )
-    else:
-        if now - bucket["ts"] > SESSION_WINDOW:
-            bucket["count"] = 0
-            bucket["ts"]    = now
 
-    return sid
+    if sid:
+        shard, lock = _session_shard(sid)
+        with lock:
+            bucket = shard.get(sid)
+            if bucket:
+                if now - bucket["ts"] > SESSION_WINDOW:
+                    bucket["count"] = 0
+                    bucket["ts"]    = now
+                    shard.set(sid, bucket, SESSION_TTL)
+                return sid, bucket
+
+    sid = secrets.token_urlsafe(32)
+    bucket = {"count": 0, "ts": now}
+    shard, lock = _session_shard(sid)
+    with lock:
+        shard.set(sid, bucket, SESSION_TTL)
+    response.set_cookie(
+        "anon_session", sid,
+        httponly=True,
+        secure=(ENVIRONMENT == "production"),
+        samesite="lax",
+        max_age=31536000,
+    )
+    return sid, bucket
 
 def verify_client(request: Request, response: Response):
     """
@@ -107,106 +184,252 @@ def verify_client(request: Request, response: Response):
     if referer and not any(referer.startswith(o) for o in ALLOWED_ORIGINS):
         raise HTTPException(status_code=403, detail="Forbidden referer")
 
-    sid = _get_session(request, response)
-    bucket = _session_store[sid]
-    if bucket["count"] >= SESSION_LIMIT:
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail="Too many requests, please wait."
-        )
-    bucket["count"] += 1
+    sid, bucket = _get_session(request, response)
+    _, lock = _session_shard(sid)
+    with lock:
+        if bucket["count"] >= SESSION_LIMIT:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please wait."
+            )
+        bucket["count"] += 1
     return True
 
+def _today_str() -> str:
+    """Today's date for download filenames, re-formatted at most once per DATE_CACHE_TTL."""
+    now = int(time.time())
+    if now - _date_cache["ts"] > DATE_CACHE_TTL:
+        _date_cache["value"] = datetime.now().strftime("%Y-%m-%d")
+        _date_cache["ts"]    = now
+    return _date_cache["value"]
+
+def _download_headers(video_info: dict, suffix: str = "") -> dict:
+    """Content-Disposition for a `<date>_<title><suffix>.json` attachment."""
+    slug = _SLUG_RE.sub("_", video_info.get("title") or "video")[:SLUG_MAX_LEN]
+    return {"Content-Disposition": f"attachment; filename=\"{_today_str()}_{slug}{suffix}.json\""}
+
+async def _gather_or_raise(*aws):
+    """Run awaitables concurrently, let all of them settle, then re-raise the first failure."""
+    results = await asyncio.gather(*aws, return_exceptions=True)
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    return results
+
+async def _fetch_video_bundle(client, video_id: str, comments_aw):
+    """
+    Fetch video info, channel info and comments for `video_id`.
+
+    Comments only need the video id, so they start right away; the channel
+    lookup starts as soon as the video's channelId is known.
+    """
+    comments_task = asyncio.ensure_future(comments_aw)
+    try:
+        video_raw = await fetch_video_info(client, video_id)
+    except BaseException:
+        comments_task.cancel()
+        # let the cancellation land so the caller can clean up what it wrapped
+        await asyncio.gather(comments_task, return_exceptions=True)
+        raise
+    channel_raw, comments = await _gather_or_raise(
+        fetch_channel_info(client, video_raw["snippet"]["channelId"]),
+        comments_task,
+    )
+    return filter_video_info(video_raw), filter_channel_info(channel_raw), comments
+
+def _encode_head(video_id: str, video_info: dict, channel_info: dict) -> bytes:
+    """Everything before the first comment thread, up to and including the open bracket."""
+    return b"".join((
+        b'{\n  "video_id": ', orjson.dumps(video_id),
+        b',\n  "video_info": ', orjson.dumps(video_info, option=_JSON_OPTS).replace(b"\n", _ENVELOPE_INDENT),
+        b',\n  "channel_info": ', orjson.dumps(channel_info, option=_JSON_OPTS).replace(b"\n", _ENVELOPE_INDENT),
+        b',\n  "comments": [',
+    ))
+
+def _encode_threads(threads: list, first: bool) -> bytes:
+    """Comment threads as list items nested two levels deep; `first` omits the leading comma."""
+    return b"".join(
+        (_THREAD_INDENT if first and i == 0 else _THREAD_SEP)
+        + orjson.dumps(thread, option=_JSON_OPTS).replace(b"\n", _THREAD_INDENT)
+        for i, thread in enumerate(threads)
+    )
+
+def _serialize_details(video_id: str, video_info: dict, channel_info: dict, comments: list) -> bytes:
+    return b"".join((
+        _encode_head(video_id, video_info, channel_info),
+        _encode_threads(comments, True),
+        _COMMENTS_TAIL if comments else _COMMENTS_TAIL_EMPTY,
+    ))
+
+async def _stream_details(video_id: str, video_info: dict, channel_info: dict, first_page: list, pages, stats: dict):
+    """
+    Encode the details payload incrementally: the envelope first, then one
+    chunk per page of comment threads as `pages` produces them.
+    """
+    yield _encode_head(video_id, video_info, channel_info)
+    count = 0
+    page = first_page
+    try:
+        while page is not None:
+            if page:
+                yield _encode_threads(page, not count)
+                count += len(page)
+                stats["comments"] = count
+            page = await anext(pages, None)
+    finally:
+        await pages.aclose()
+        stats["duration"] = time.time() - stats["start"]
+    yield _COMMENTS_TAIL if count else _COMMENTS_TAIL_EMPTY
+
+async def _claim_details(key: str):
+    """
+    Wait for any concurrent scrape of `key` to finish; return a once-only release.
+
+    The wait is bounded by DETAILS_LOCK_WAIT so a stuck request can't stall
+    everyone else; past it the caller scrapes without holding the lock.
+    """
+    lock = _details_cache.lock(key)
+    try:
+        await asyncio.wait_for(lock.acquire(), DETAILS_LOCK_WAIT)
+    except asyncio.TimeoutError:
+        return lambda: None
+    released = False
+
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            lock.release()
+    return release
+
+async def _cache_stream(chunks, key: str, entry: dict, stats: dict, release):
+    """
+    Pass `chunks` through and cache the whole body once it has been streamed
+    completely, unless it grows past DETAILS_BODY_MAX. `release` is called as
+    soon as the outcome is known, so waiting requests can proceed.
+    """
+    parts, size = [], 0
+    try:
+        async for chunk in chunks:
+            if parts is not None:
+                size += len(chunk)
+                if size > DETAILS_BODY_MAX:
+                    parts = None  # too large to keep; stream only
+                    release()
+                else:
+                    parts.append(chunk)
+            yield chunk
+        if parts is not None:
+            entry["body"] = b"".join(parts)
+            entry["comments"] = stats["comments"]
+            _details_cache.set(key, entry, DETAILS_CACHE_TTL)
+    finally:
+        release()
+        await chunks.aclose()
+
+async def _notify_discord(video_info: dict, channel_info: dict, stats: dict):
+    """
+    Send the Discord webhook; `stats` is read only now, after the response went out.
+
+    A stream cut short by a client disconnect may never reach its cleanup, so
+    `stats` must already hold usable values when the response is returned.
+    """
+    await send_discord_webhook(
+        video_name=video_info.get("title", "Unknown"),
+        comment_count=stats["comments"],
+        view_count=int(video_info.get("viewCount", 0)),
+        like_count=int(video_info.get("likeCount", 0)),
+        channel_name=channel_info.get("title", "Unknown"),
+        subscriber_count=int(channel_info.get("subscriberCount", 0)),
+        video_count=int(channel_info.get("videoCount", 0)),
+        processing_time=stats["duration"]
+    )
+
 # ─── Endpoints ────────────────────────────────────────────────────────────────
 @app.get("/videos/{video_id}/details")
 @limiter.limit("10/minute")
 async def get_video_details(
     request: Request,
     response: Response,
+    background_tasks: BackgroundTasks,
     video_id: str,
+    sentiment: Literal["vader", "both"] = "vader",
     _: bool = Depends(verify_client),
 ):
-    start = time.time()
-    async with AsyncClient(timeout=10.0) as client:
-        video_raw    = await fetch_video_info(client, video_id)
-        video_info   = filter_video_info(video_raw)
-        channel_raw  = await fetch_channel_info(client, video_raw["snippet"]["channelId"])
-        channel_info = filter_channel_info(channel_raw)
-        comments     = await fetch_all_comments(client, video_id)
-
-    result = {
-        "video_id": video_id,
-        "video_info": video_info,
-        "channel_info": channel_info,
-        "comments": comments,
-    }
-    duration = time.time() - start
-    
-    # Send Discord webhook
-    await send_discord_webhook(
-        video_name=video_info.get("title", "Unknown"),
-        comment_count=len(comments),
-        view_count=int(video_info.get("viewCount", 0)),
-        like_count=int(video_info.get("likeCount", 0)),
-        channel_name=channel_info.get("title", "Unknown"),
-        subscriber_count=int(channel_info.get("subscriberCount", 0)),
-        video_count=int(channel_info.get("videoCount", 0)),
-        processing_time=duration
-    )
+    stats  = {"start": time.time()}
+    key    = f"{video_id}:{sentiment}"
+    cached = _details_cache.get(key)
+    if cached is None:
+        # concurrent misses for the same video wait for one scrape to fill the cache
+        release = await _claim_details(key)
+        cached = _details_cache.get(key)
+        if cached is not None:
+            release()
+    if cached is not None:
+        stats.update(comments=cached["comments"], duration=time.time() - stats["start"])
+        background_tasks.add_task(_notify_discord, cached["video_info"], cached["channel_info"], stats)
+        return Response(
+            cached["body"],
+            media_type="application/json",
+            headers=_download_headers(cached["video_info"]),
+        )
 
-    # prepare filename
-    today    = datetime.now().strftime("%Y-%m-%d")
-    slug     = re.sub(r"[^\w\-]+", "_", video_info.get("title", "video"))
-    filename = f"{today}_{slug}.json"
+    client = request.app.state.http
+    # comments are streamed page by page; only the first page is awaited
+    # here so comment errors still surface as a proper HTTP error
+    pages = iter_comment_pages(client, video_id, sentiment)
+    try:
+        video_info, channel_info, first_page = await _fetch_video_bundle(
+            client, video_id, anext(pages, None)
+        )
+    except BaseException:
+        # stop the prefetcher and any backfills the first page already started
+        await pages.aclose()
+        release()
+        raise
+    # a stream abandoned before it starts never reaches _cache_stream's cleanup
+    background_tasks.add_task(release)
 
-    def iter_json():
-        yield json.dumps(result, ensure_ascii=False, indent=2)
+    # Send Discord webhook once the whole response has been streamed; the
+    # stream keeps these up to date, they are only what gets reported if it
+    # is abandoned before sending anything
+    stats.update(comments=0, duration=time.time() - stats["start"])
+    background_tasks.add_task(_notify_discord, video_info, channel_info, stats)
 
-    headers = {"Content-Disposition": f"attachment; filename=\"{filename}\""}
-    return StreamingResponse(iter_json(), media_type="application/json", headers=headers)
+    entry = {"video_info": video_info, "channel_info": channel_info}
+    return StreamingResponse(
+        _cache_stream(
+            _stream_details(video_id, video_info, channel_info, first_page, pages, stats),
+            key, entry, stats, release,
+        ),
+        media_type="application/json",
+        headers=_download_headers(video_info),
+    )
 
 @app.get("/videos/{video_id}/top-comments")
 @limiter.limit("10/minute")
 async def get_top_comments(
     request: Request,
     response: Response,
+    background_tasks: BackgroundTasks,
     video_id: str,
+    sentiment: Literal["vader", "both"] = "vader",
     _: bool = Depends(verify_client),
 ):
     start = time.time()
-    async with AsyncClient(timeout=10.0) as client:
-        video_raw    = await fetch_video_info(client, video_id)
-        video_info   = filter_video_info(video_raw)
-        channel_raw  = await fetch_channel_info(client, video_raw["snippet"]["channelId"])
-        channel_info = filter_channel_info(channel_raw)
-        comments     = await fetch_top_comments(client, video_id, limit=100)
-
-    result = {
-        "video_id": video_id,
-        "video_info": video_info,
-        "channel_info": channel_info,
-        "comments": comments,
-    }
-    duration = time.time() - start
-    
-    # Send Discord webhook
-    await send_discord_webhook(
-        video_name=video_info.get("title", "Unknown"),
-        comment_count=len(comments),
-        view_count=int(video_info.get("viewCount", 0)),
-        like_count=int(video_info.get("likeCount", 0)),
-        channel_name=channel_info.get("title", "Unknown"),
-        subscriber_count=int(channel_info.get("subscriberCount", 0)),
-        video_count=int(channel_info.get("videoCount", 0)),
-        processing_time=duration
+    client = request.app.state.http
+    video_info, channel_info, comments = await _fetch_video_bundle(
+        client, video_id, fetch_top_comments(client, video_id, limit=100, sentiment=sentiment)
     )
 
-    today    = datetime.now().strftime("%Y-%m-%d")
-    slug     = re.sub(r"[^\w\-]+", "_", video_info.get("title", "video"))
-    filename = f"{today}_{slug}_top_comments.json"
+    stats = {"comments": len(comments), "duration": time.time() - start}
 
-    def iter_json():
-        yield json.dumps(result, ensure_ascii=False, indent=2)
+    # Send Discord webhook once the response has gone out
+    background_tasks.add_task(_notify_discord, video_info, channel_info, stats)
 
-    headers = {"Content-Disposition": f"attachment; filename=\"{filename}\""}
-    return StreamingResponse(iter_json(), media_type="application/json", headers=headers)
\ No newline at end of file
+    # already-encoded bytes: skips jsonable_encoder and a one-chunk stream
+    return Response(
+        _serialize_details(video_id, video_info, channel_info, comments),
+        media_type="application/json",
+        headers=_download_headers(video_info, "_top_comments"),
+    )
\ No newline at end of file
@@ -3,6 +3,7 @@
 import os
 import datetime
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import WriteConcern
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -13,10 +14,12 @@ MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB = os.getenv("MONGO_DB", "mydatabase")
 MONGO_COLLECTION = os.getenv("MONGO_COLLECTION", "records")
 
-# Initialize the MongoDB client and select the database and collection
+# Initialize the MongoDB client and select the database and collection.
+# Records are telemetry nobody reads back in the request path, so writes are
+# unacknowledged (w=0): insert_one returns without waiting for the server.
 client = AsyncIOMotorClient(MONGO_URI)
 db = client[MONGO_DB]
-collection = db[MONGO_COLLECTION]
+collection = db.get_collection(MONGO_COLLECTION, write_concern=WriteConcern(w=0))
 
 async def store_data(data: dict, processing_time: float) -> None:
     """
@@ -28,10 +31,10 @@ async def store_data(data: dict, processing_time: float) -> None:
     
     This extra processing_time field will only be stored in the database, not sent to the frontend.
     """
-    # Create a copy of the data to store, so the original data for the frontend is not modified.
-    data_to_store = data.copy()
-    data_to_store["processing_time"] = processing_time
-    data_to_store["stored_at"] = datetime.datetime.utcnow()
-    
-    # Insert the document into the MongoDB collection
-    await collection.insert_one(data_to_store)
+    # Insert a thin envelope that shares data's values by reference; Motor
+    # injects "_id" into this envelope, so the frontend's dict stays untouched.
+    await collection.insert_one({
+        **data,
+        "processing_time": processing_time,
+        "stored_at": datetime.datetime.utcnow(),
+    })
@@ -8,6 +8,35 @@ from typing import Optional
 # Get Discord webhook URL from environment
 DISCORD_WEBHOOK_URL = os.getenv("DISCORD_WEBHOOK_URL")
 
+# one pooled client for every webhook, created on first use; close_discord_client()
+# is called from the app lifespan
+_discord_client: Optional[httpx.AsyncClient] = None
+
+# Format numbers with commas for better readability
+_format_number = "{:,}".format
+
+# static parts of the embed; per-call fields are merged in
+_EMBED_TEMPLATE = {
+    "title": "🎥 YouTube Video Processed",
+    "color": 0xFF0000,  # YouTube red
+    "footer": {
+        "text": "Social Data Extract API",
+        "icon_url": "https://cdn.discordapp.com/attachments/1234567890/youtube-icon.png"
+    }
+}
+
+def _get_client() -> httpx.AsyncClient:
+    global _discord_client
+    if _discord_client is None:
+        _discord_client = httpx.AsyncClient(timeout=10.0, http2=True)
+    return _discord_client
+
+async def close_discord_client() -> None:
+    global _discord_client
+    if _discord_client is not None:
+        await _discord_client.aclose()
+        _discord_client = None
+
 async def send_discord_webhook(
     video_name: str,
     comment_count: int,
@@ -38,24 +67,19 @@ async def send_discord_webhook(
         print("Discord webhook URL not configured, skipping webhook")
         return None
     
-    # Format numbers with commas for better readability
-    def format_number(num: int) -> str:
-        return f"{num:,}"
-    
     # Create embed for Discord
     embed = {
-        "title": "🎥 YouTube Video Processed",
+        **_EMBED_TEMPLATE,
         "description": f"**{video_name}**",
-        "color": 0xFF0000,  # YouTube red
         "fields": [
             {
                 "name": "📊 Video Stats",
-                "value": f"**Comments:** {format_number(comment_count)}\n**Views:** {format_number(view_count)}\n**Likes:** {format_number(like_count)}",
+                "value": f"**Comments:** {_format_number(comment_count)}\n**Views:** {_format_number(view_count)}\n**Likes:** {_format_number(like_count)}",
                 "inline": True
             },
             {
                 "name": "📺 Channel Info",
-                "value": f"**Channel:** {channel_name}\n**Subscribers:** {format_number(subscriber_count)}\n**Videos:** {format_number(video_count)}",
+                "value": f"**Channel:** {channel_name}\n**Subscribers:** {_format_number(subscriber_count)}\n**Videos:** {_format_number(video_count)}",
                 "inline": True
             },
             {
@@ -64,11 +88,7 @@ async def send_discord_webhook(
                 "inline": False
             }
         ],
-        "timestamp": datetime.utcnow().isoformat(),
-        "footer": {
-            "text": "Social Data Extract API",
-            "icon_url": "https://cdn.discordapp.com/attachments/1234567890/youtube-icon.png"
-        }
+        "timestamp": datetime.utcnow().isoformat()
     }
     
     # Discord webhook payload
@@ -77,16 +97,15 @@ async def send_discord_webhook(
     }
     
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(DISCORD_WEBHOOK_URL, json=payload)
+        response = await _get_client().post(DISCORD_WEBHOOK_URL, json=payload)
+        
+        if response.status_code == 204:  # Discord webhook success
+            print(f"Discord webhook sent successfully for video: {video_name}")
+            return True
+        else:
+            print(f"Discord webhook failed with status {response.status_code}: {response.text}")
+            return False
             
-            if response.status_code == 204:  # Discord webhook success
-                print(f"Discord webhook sent successfully for video: {video_name}")
-                return True
-            else:
-                print(f"Discord webhook failed with status {response.status_code}: {response.text}")
-                return False
-                
     except Exception as e:
         print(f"Error sending Discord webhook: {str(e)}")
         return False
\ No newline at end of file
@@ -0,0 +1,66 @@
+# Path: utils/ttl_cache.py
+
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any
+
+class TTLCache:
+    """
+    Bounded in-memory cache whose entries expire after a per-entry TTL.
+
+    Least-recently-used entries are evicted once `maxsize` is exceeded.
+    `lock(key)` hands out a per-key asyncio.Lock so concurrent misses for the
+    same key can wait on a single fetch instead of stampeding the upstream.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._locks: dict = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def lock(self, key: str) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    def expire(self) -> int:
+        """Drop expired entries and idle key locks; return how many entries were removed."""
+        now = time.monotonic()
+        stale = [k for k, (expires_at, _) in self._data.items() if expires_at <= now]
+        for k in stale:
+            del self._data[k]
+        for k in [k for k, lock in self._locks.items() if not lock.locked()]:
+            del self._locks[k]
+        return len(stale)
+
+async def sweep_periodically(cache: TTLCache, interval: float) -> None:
+    """Call `cache.expire()` every `interval` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        cache.expire()
@@ -1,148 +1,479 @@
 # Path: utils/youtube_utils.py
 
 import os
+import re
+import time
+import random
+import string
+import asyncio
 import certifi
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from functools import lru_cache
+from itertools import chain
 import nltk
-from textblob import TextBlob
 from nltk.sentiment.vader import SentimentIntensityAnalyzer
 import httpx
+import orjson
+from types import MappingProxyType
+from typing import Optional
 from fastapi import HTTPException
+from utils.ttl_cache import TTLCache
 
-# ensure cert and vader are ready
+# ensure cert and vader are ready; the Docker image bakes the lexicon into
+# $NLTK_DATA, so the download only happens in environments without it
 os.environ["SSL_CERT_FILE"] = certifi.where()
-nltk.download("vader_lexicon", quiet=True)
+try:
+    nltk.data.find("sentiment/vader_lexicon.zip")
+except LookupError:
+    nltk.download("vader_lexicon", quiet=True)
 _sia = SentimentIntensityAnalyzer()
 
+# VADER only scores tokens found in its lexicon, so texts without a single
+# lexicon hit are neutral and can skip its (costly) SentiText tokenization.
+# Pool workers are forked and inherit these instead of reloading the lexicon.
+_VADER_KEYS  = frozenset(_sia.lexicon)
+_PUNCT_TABLE = str.maketrans("", "", string.punctuation)
+
+# ((neg, neu, pos, compound), (polarity, subjectivity)) both analyzers give
+# texts with nothing to score: under two characters, or a bare link
+_NO_TOKEN_SCORES = ((0.0, 0.0, 0.0, 0.0), (0.0, 0.0))
+_URL_ONLY_SCORES = ((0.0, 1.0, 0.0, 0.0), (0.0, 0.0))
+_URL_ONLY_RE     = re.compile(r"https?://[\w.~/?#=&%+-]+")
+
 # load API key once
 YOUTUBE_DATA_API_KEY = os.getenv("YOUTUBE_DATA_API_KEY")
 if not YOUTUBE_DATA_API_KEY:
     raise RuntimeError("YOUTUBE_DATA_API_KEY environment variable not set.")
 
+# every YouTube call goes through _youtube_get: at most this many in flight per
+# process, backing off exponentially on 429/503 (YouTube enforces per-second quota)
+YOUTUBE_MAX_CONCURRENCY = int(os.getenv("YOUTUBE_MAX_CONCURRENCY", "8"))
+YOUTUBE_MAX_RETRIES     = 4
+_RETRY_STATUSES   = {429, 503}
+_RETRY_BASE_DELAY = 0.5  # seconds
+_yt_sem = asyncio.Semaphore(YOUTUBE_MAX_CONCURRENCY)
+# reply chains fetched at once per scrape; kept under the global cap so the
+# page producer is never starved by queued reply requests
+REPLY_FETCH_CONCURRENCY = max(1, YOUTUBE_MAX_CONCURRENCY - 2)
+# comment-thread pages fetched ahead of the one being parsed, and parsed pages
+# still being scored/backfilled before the consumer stops pulling new ones
+PAGE_PREFETCH = 2
+
+# sentiment is scored after fetching, in batches of this many texts per worker task
+SENTIMENT_CHUNK_SIZE = 64
+# distinct (whitespace-normalized) texts memoized per process
+SENTIMENT_CACHE_SIZE = 4096
+_sentiment_pool = None
+_textblob_analyzer = None
+
+# video/channel metadata changes slowly, so it is cached per process (seconds)
+VIDEO_INFO_TTL   = 300
+CHANNEL_INFO_TTL = 3600
+NOT_FOUND_TTL    = 60
+# stale entries are kept this long so they can be revalidated with their ETag
+REVALIDATE_TTL   = 86400
+metadata_cache = TTLCache(maxsize=1024)
+
+# pooled client settings: one HTTP/2 client is shared app-wide so requests are
+# multiplexed over kept-alive connections, and transient connect failures are
+# retried by the transport. Google APIs only gzip responses when the
+# User-Agent also contains "gzip"; httpx decompresses transparently.
+_YT_HEADERS = {"Accept-Encoding": "gzip", "User-Agent": "postmetr/1.0 (gzip)"}
+_YT_TIMEOUT = httpx.Timeout(20.0, connect=5.0)
+_YT_LIMITS  = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+# partial-response masks: only request the fields the filter_* helpers keep
+_COMMENT_MASK = "id,snippet(authorDisplayName,textDisplay,publishedAt,likeCount)"
+_VIDEO_FIELDS = "items(id,snippet(title,description,publishedAt,channelId),statistics(viewCount,likeCount,commentCount))"
+_CHANNEL_FIELDS = "items(id,snippet(title,description,publishedAt),statistics(subscriberCount,videoCount))"
+_COMMENT_THREAD_FIELDS = (
+    f"items(snippet(totalReplyCount,topLevelComment({_COMMENT_MASK})),"
+    f"replies(comments({_COMMENT_MASK}))),nextPageToken"
+)
+_COMMENT_FIELDS = f"items({_COMMENT_MASK}),nextPageToken"
+
+# static part of each endpoint's query; fetchers merge in ids and page tokens
+_API_BASE = "https://www.googleapis.com/youtube/v3"
+_VIDEOS_URL          = f"{_API_BASE}/videos"
+_CHANNELS_URL        = f"{_API_BASE}/channels"
+_COMMENT_THREADS_URL = f"{_API_BASE}/commentThreads"
+_COMMENTS_URL        = f"{_API_BASE}/comments"
+_VIDEO_PARAMS = MappingProxyType({
+    "key": YOUTUBE_DATA_API_KEY,
+    "part": "snippet,statistics",
+    "fields": _VIDEO_FIELDS
+})
+_CHANNEL_PARAMS = MappingProxyType({
+    "key": YOUTUBE_DATA_API_KEY,
+    "part": "snippet,statistics",
+    "fields": _CHANNEL_FIELDS
+})
+_COMMENT_THREAD_PARAMS = MappingProxyType({
+    "key": YOUTUBE_DATA_API_KEY,
+    "textFormat": "plainText",
+    "part": "snippet,replies",
+    "maxResults": 100,
+    "fields": _COMMENT_THREAD_FIELDS
+})
+_COMMENT_PARAMS = MappingProxyType({
+    "key": YOUTUBE_DATA_API_KEY,
+    "textFormat": "plainText",
+    "part": "snippet",
+    "maxResults": 100,
+    "fields": _COMMENT_FIELDS
+})
+
+def new_youtube_client() -> httpx.AsyncClient:
+    """Build an AsyncClient tuned for YouTube Data API calls; share one per process."""
+    transport = httpx.AsyncHTTPTransport(http2=True, retries=3, limits=_YT_LIMITS)
+    return httpx.AsyncClient(headers=_YT_HEADERS, timeout=_YT_TIMEOUT, transport=transport)
+
+# shared read-only default for missing sub-objects, instead of a fresh {} per call
+_EMPTY = MappingProxyType({})
+
+# output keys copied verbatim from the API's snippet/statistics objects
+_VIDEO_SNIPPET_KEYS   = ("title", "description", "publishedAt")
+_VIDEO_STAT_KEYS      = ("viewCount", "likeCount", "commentCount")
+_CHANNEL_SNIPPET_KEYS = ("title", "description", "publishedAt")
+_CHANNEL_STAT_KEYS    = ("subscriberCount", "videoCount")
+
 def filter_video_info(video_info: dict) -> dict:
-    snippet = video_info.get("snippet", {})
-    statistics = video_info.get("statistics", {})
+    sg = video_info.get("snippet", _EMPTY).get
+    stg = video_info.get("statistics", _EMPTY).get
     return {
         "id": video_info.get("id"),
-        "title": snippet.get("title"),
-        "description": snippet.get("description"),
-        "publishedAt": snippet.get("publishedAt"),
-        "viewCount": statistics.get("viewCount"),
-        "likeCount": statistics.get("likeCount"),
-        "commentCount": statistics.get("commentCount")
+        **{k: sg(k) for k in _VIDEO_SNIPPET_KEYS},
+        **{k: stg(k) for k in _VIDEO_STAT_KEYS},
     }
 
 def filter_channel_info(channel_info: dict) -> dict:
-    snippet = channel_info.get("snippet", {})
-    statistics = channel_info.get("statistics", {})
+    sg = channel_info.get("snippet", _EMPTY).get
+    stg = channel_info.get("statistics", _EMPTY).get
     return {
         "id": channel_info.get("id"),
-        "title": snippet.get("title"),
-        "description": snippet.get("description"),
-        "publishedAt": snippet.get("publishedAt"),
-        "subscriberCount": statistics.get("subscriberCount"),
-        "videoCount": statistics.get("videoCount")
+        **{k: sg(k) for k in _CHANNEL_SNIPPET_KEYS},
+        **{k: stg(k) for k in _CHANNEL_STAT_KEYS},
     }
 
-def analyze_sentiment(text: str) -> dict:
-    # TextBlob
-    blob = TextBlob(text)
-    tb = {"polarity": blob.sentiment.polarity, "subjectivity": blob.sentiment.subjectivity}
-    # VADER
-    vd = _sia.polarity_scores(text)
-    return {"textblob": tb, "vader": vd}
+def analyze_sentiment(text: str, mode: str = "vader") -> dict:
+    """
+    Score `text` with VADER, plus TextBlob when `mode` is "both".
+
+    TextBlob's pattern analyzer is several times slower than VADER and mostly
+    redundant with it, so it only runs on request.
+    """
+    # whitespace-normalized so repeated comments ("First!", emoji spam) share a cache entry
+    text = " ".join(text.split())
+    if len(text) < 2:
+        trivial = _NO_TOKEN_SCORES
+    elif _URL_ONLY_RE.fullmatch(text):
+        trivial = _URL_ONLY_SCORES
+    else:
+        trivial = None
+    neg, neu, pos, compound = trivial[0] if trivial else _vader_cached(text)
+    vader = {"neg": neg, "neu": neu, "pos": pos, "compound": compound}
+    if mode != "both":
+        return {"vader": vader}
+    polarity, subjectivity = trivial[1] if trivial else _textblob_cached(text)
+    return {"textblob": {"polarity": polarity, "subjectivity": subjectivity}, "vader": vader}
+
+@lru_cache(maxsize=SENTIMENT_CACHE_SIZE)
+def _vader_cached(text: str) -> tuple:
+    vd = _vader_scores(text)
+    return (vd["neg"], vd["neu"], vd["pos"], vd["compound"])
+
+@lru_cache(maxsize=SENTIMENT_CACHE_SIZE)
+def _textblob_cached(text: str) -> tuple:
+    global _textblob_analyzer
+    if _textblob_analyzer is None:
+        # only imported once "both" is requested; calling the analyzer that
+        # TextBlob(text).sentiment would use skips building a blob per text
+        from textblob.sentiments import PatternAnalyzer
+        _textblob_analyzer = PatternAnalyzer()
+    polarity, subjectivity = _textblob_analyzer.analyze(text)
+    return (polarity, subjectivity)
+
+def _vader_scores(text: str) -> dict:
+    # same tokens VADER considers: whitespace-split, len > 1, with or without punctuation
+    tokens = [w.lower() for w in text.split() if len(w) > 1]
+    if any(w in _VADER_KEYS or w.translate(_PUNCT_TABLE) in _VADER_KEYS for w in tokens):
+        return _sia.polarity_scores(text)
+    return {"neg": 0.0, "neu": 1.0 if tokens else 0.0, "pos": 0.0, "compound": 0.0}
 
 def filter_comment(comment: dict) -> dict:
-    snippet = comment.get("snippet", {})
-    text = snippet.get("textDisplay", "")
+    # runs once per comment, so the snippet's bound get is looked up once
+    sg = comment.get("snippet", _EMPTY).get
     return {
         "id": comment.get("id"),
-        "author": snippet.get("authorDisplayName"),
-        "text": text,
-        "publishedAt": snippet.get("publishedAt"),
-        "likeCount": snippet.get("likeCount"),
-        "sentiment": analyze_sentiment(text)
+        "author": sg("authorDisplayName"),
+        "text": sg("textDisplay", ""),
+        "publishedAt": sg("publishedAt"),
+        "likeCount": sg("likeCount"),
     }
 
+def _parse_thread(item: dict):
+    """Build {"comment", "replies"} from a commentThreads item, or None if it has no top-level comment."""
+    try:
+        top = item["snippet"]["topLevelComment"]
+    except KeyError:
+        return None
+    # the fields mask omits "replies" entirely when a thread has none
+    embedded = item.get("replies")
+    replies = list(map(filter_comment, embedded["comments"])) if embedded else []
+    return {"comment": filter_comment(top), "replies": replies}
+
+def _get_sentiment_pool() -> ProcessPoolExecutor:
+    global _sentiment_pool
+    if _sentiment_pool is None:
+        _sentiment_pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _sentiment_pool
+
+def shutdown_sentiment_pool() -> None:
+    global _sentiment_pool
+    if _sentiment_pool is not None:
+        _sentiment_pool.shutdown(cancel_futures=True)
+        _sentiment_pool = None
+
+def _score_batch(texts: list, mode: str) -> list:
+    return [analyze_sentiment(t, mode) for t in texts]
+
+async def score_comments(comments: list, mode: str = "vader") -> list:
+    """
+    Set "sentiment" on every comment dict in `comments`, in one batched pass.
+
+    Texts are split into chunks and scored in the worker processes so the
+    tokenizer-heavy analyzers neither block the event loop nor share a GIL;
+    a batch that fits in one chunk is scored on a thread instead.
+    """
+    texts = [c["text"] for c in comments]
+    if len(texts) <= SENTIMENT_CHUNK_SIZE:
+        # a single chunk isn't worth the pickling round-trip to a worker process
+        chunks = [await asyncio.to_thread(_score_batch, texts, mode)] if texts else []
+    else:
+        loop = asyncio.get_running_loop()
+        pool = _get_sentiment_pool()
+        chunks = await asyncio.gather(*[
+            loop.run_in_executor(pool, _score_batch, texts[i:i + SENTIMENT_CHUNK_SIZE], mode)
+            for i in range(0, len(texts), SENTIMENT_CHUNK_SIZE)
+        ])
+    for c, sentiment in zip(comments, chain.from_iterable(chunks)):
+        c["sentiment"] = sentiment
+    return comments
+
+async def attach_sentiments(threads: list, mode: str = "vader") -> list:
+    """Score every comment and reply in `threads`."""
+    await score_comments([c for t in threads for c in (t["comment"], *t["replies"])], mode)
+    return threads
+
+async def _youtube_get(client: httpx.AsyncClient, url: str, params: dict, headers: Optional[dict] = None) -> httpx.Response:
+    """GET a YouTube API url under the process-wide concurrency cap, retrying 429/503 with backoff."""
+    for attempt in range(YOUTUBE_MAX_RETRIES + 1):
+        async with _yt_sem:
+            resp = await client.get(url, params=params, headers=headers)
+        if resp.status_code not in _RETRY_STATUSES or attempt == YOUTUBE_MAX_RETRIES:
+            return resp
+        await asyncio.sleep(_RETRY_BASE_DELAY * 2 ** attempt + random.random())
+
+def _raise_for_status(resp: httpx.Response, detail: str) -> None:
+    """Translate a non-2xx YouTube response into an HTTPException with the same status."""
+    try:
+        resp.raise_for_status()
+    except httpx.HTTPStatusError:
+        raise HTTPException(status_code=resp.status_code, detail=detail) from None
+
+async def _cached(key: str, ttl: float, fetch) -> dict:
+    """
+    Return the cached resource for `key`, calling `fetch(etag)` once it goes stale.
+
+    Stale entries are revalidated with their ETag, and a 304 only extends their
+    freshness. 404s are cached for NOT_FOUND_TTL.
+    """
+    entry = metadata_cache.get(key)
+    if entry is None or entry["fresh_until"] <= time.monotonic():
+        async with metadata_cache.lock(key):
+            entry = metadata_cache.get(key)
+            now = time.monotonic()
+            if entry is None or entry["fresh_until"] <= now:
+                try:
+                    fetched = await fetch(entry and entry["etag"])
+                except HTTPException as e:
+                    if e.status_code != 404:
+                        raise
+                    entry = {"etag": None, "body": None, "error": e, "fresh_until": now + NOT_FOUND_TTL}
+                else:
+                    if fetched is not None:  # None means 304 Not Modified
+                        etag, body = fetched
+                        entry = {"etag": etag, "body": body, "error": None}
+                    entry["fresh_until"] = now + ttl
+                metadata_cache.set(key, entry, REVALIDATE_TTL)
+    if entry["error"] is not None:
+        raise HTTPException(status_code=entry["error"].status_code, detail=entry["error"].detail)
+    return entry["body"]
+
 async def fetch_video_info(client: httpx.AsyncClient, video_id: str) -> dict:
-    url = "https://www.googleapis.com/youtube/v3/videos"
-    params = {
-        "key": YOUTUBE_DATA_API_KEY,
-        "part": "snippet,contentDetails,statistics",
-        "id": video_id
-    }
-    resp = await client.get(url, params=params)
-    if resp.status_code != 200:
-        raise HTTPException(status_code=resp.status_code, detail="Error fetching video information")
-    items = resp.json().get("items") or []
+    return await _cached(f"v:{video_id}", VIDEO_INFO_TTL, lambda etag: _fetch_video_info(client, video_id, etag))
+
+async def fetch_channel_info(client: httpx.AsyncClient, channel_id: str) -> dict:
+    return await _cached(f"c:{channel_id}", CHANNEL_INFO_TTL, lambda etag: _fetch_channel_info(client, channel_id, etag))
+
+async def _fetch_video_info(client: httpx.AsyncClient, video_id: str, etag: Optional[str] = None):
+    """Return (etag, video resource), or None if `etag` is still current."""
+    params = {**_VIDEO_PARAMS, "id": video_id}
+    headers = {"If-None-Match": etag} if etag else None
+    resp = await _youtube_get(client, _VIDEOS_URL, params, headers)
+    if resp.status_code == 304:
+        return None
+    _raise_for_status(resp, "Error fetching video information")
+    items = orjson.loads(resp.content).get("items") or []
     if not items:
         raise HTTPException(status_code=404, detail="Video not found")
-    return items[0]
+    return resp.headers.get("etag"), items[0]
 
-async def fetch_channel_info(client: httpx.AsyncClient, channel_id: str) -> dict:
-    url = "https://www.googleapis.com/youtube/v3/channels"
-    params = {"key": YOUTUBE_DATA_API_KEY, "part": "snippet,statistics", "id": channel_id}
-    resp = await client.get(url, params=params)
-    if resp.status_code != 200:
-        raise HTTPException(status_code=resp.status_code, detail="Error fetching channel information")
-    items = resp.json().get("items") or []
+async def _fetch_channel_info(client: httpx.AsyncClient, channel_id: str, etag: Optional[str] = None):
+    """Return (etag, channel resource), or None if `etag` is still current."""
+    params = {**_CHANNEL_PARAMS, "id": channel_id}
+    headers = {"If-None-Match": etag} if etag else None
+    resp = await _youtube_get(client, _CHANNELS_URL, params, headers)
+    if resp.status_code == 304:
+        return None
+    _raise_for_status(resp, "Error fetching channel information")
+    items = orjson.loads(resp.content).get("items") or []
     if not items:
         raise HTTPException(status_code=404, detail="Channel not found")
-    return items[0]
+    return resp.headers.get("etag"), items[0]
 
-async def fetch_all_comments(client: httpx.AsyncClient, video_id: str) -> list:
-    # (unchanged – returns every comment, sorted by default order)
-    url = "https://www.googleapis.com/youtube/v3/commentThreads"
-    params = {
-        "key": YOUTUBE_DATA_API_KEY,
-        "textFormat": "plainText",
-        "part": "snippet,replies",
-        "videoId": video_id,
-        "maxResults": 100
-    }
-    all_comments = []
+async def iter_comment_pages(client: httpx.AsyncClient, video_id: str, sentiment: str = "vader"):
+    """
+    Yield every comment thread of `video_id`, one list per API page, in order.
+
+    Pages are fetched ahead of parsing; while later pages load, each parsed
+    page is scored and its truncated reply chains are backfilled (and scored);
+    a backfill lost to a 404, 5xx or network error keeps the embedded replies
+    and flags the thread "repliesTruncated"; other client errors (e.g. 403
+    quotaExceeded) abort the listing.
+    A page is yielded once all of its work is done.
+    """
+    params = {**_COMMENT_THREAD_PARAMS, "videoId": video_id}
+    pages = asyncio.Queue(maxsize=PAGE_PREFETCH)
+    in_flight = deque()  # (threads, tasks) per parsed page, oldest first
+    sem = asyncio.Semaphore(REPLY_FETCH_CONCURRENCY)
+
+    async def fetch_remaining(thread: dict) -> None:
+        try:
+            async with sem:
+                replies = await fetch_comment_replies(client, thread["comment"]["id"])
+        except HTTPException as e:
+            # quota exhaustion (403) and other client errors would hit every
+            # later request too, so they fail the whole listing
+            if 400 <= e.status_code < 500 and e.status_code != 404:
+                raise
+            replies = thread["replies"]
+            thread["repliesTruncated"] = True
+        except httpx.HTTPError:
+            # transient failures keep the replies embedded in the thread,
+            # flagged so clients can tell the chain is incomplete
+            replies = thread["replies"]
+            thread["repliesTruncated"] = True
+        thread["replies"] = await score_comments(replies, sentiment)
+
+    async def fetch_pages():
+        token = None
+        try:
+            while True:
+                if token:
+                    params["pageToken"] = token
+                resp = await _youtube_get(client, _COMMENT_THREADS_URL, params)
+                _raise_for_status(resp, "Error fetching comments")
+                data = orjson.loads(resp.content)
+                token = data.get("nextPageToken")
+                await pages.put(data.get("items", ()))
+                if not token:
+                    break
+        except Exception as e:
+            # hand the failure to the consumer so it stops waiting for pages
+            await pages.put(e)
+            return
+        await pages.put(None)
+
+    producer = asyncio.create_task(fetch_pages())
+    try:
+        while (items := await pages.get()) is not None:
+            if isinstance(items, Exception):
+                raise items
+            threads, page_comments, tasks = [], [], []
+            for item in items:
+                thread = _parse_thread(item)
+                if thread is None:
+                    continue
+                page_comments.append(thread["comment"])
+                if item["snippet"].get("totalReplyCount", 0) > len(thread["replies"]):
+                    tasks.append(asyncio.create_task(fetch_remaining(thread)))
+                else:
+                    page_comments.extend(thread["replies"])
+                threads.append(thread)
+            tasks.append(asyncio.create_task(score_comments(page_comments, sentiment)))
+            in_flight.append((threads, tasks))
+            # hand out finished pages without waiting on the newer ones
+            while in_flight and all(t.done() for t in in_flight[0][1]):
+                threads, tasks = in_flight.popleft()
+                for t in tasks:
+                    t.result()
+                yield threads
+            # a slow page (e.g. a long reply chain) holds back the pages behind
+            # it; wait it out rather than buffering the rest of the video
+            while len(in_flight) >= PAGE_PREFETCH:
+                threads, tasks = in_flight[0]
+                await asyncio.gather(*tasks)
+                in_flight.popleft()
+                yield threads
+        while in_flight:
+            threads, tasks = in_flight[0]
+            await asyncio.gather(*tasks)
+            in_flight.popleft()
+            yield threads
+    finally:
+        producer.cancel()
+        for _, tasks in in_flight:
+            for t in tasks:
+                t.cancel()
+
+async def fetch_comment_replies(client: httpx.AsyncClient, parent_id: str) -> list:
+    """
+    Fetch every reply to the top-level comment `parent_id`.
+    """
+    params = {**_COMMENT_PARAMS, "parentId": parent_id}
+    replies = []
     token = None
     while True:
         if token:
             params["pageToken"] = token
-        resp = await client.get(url, params=params)
-        if resp.status_code != 200:
-            raise HTTPException(status_code=resp.status_code, detail="Error fetching comments")
-        data = resp.json()
-        for item in data.get("items", []):
-            top = item.get("snippet", {}).get("topLevelComment")
-            if not top:
-                continue
-            c = filter_comment(top)
-            replies = [filter_comment(r) for r in item.get("replies", {}).get("comments", [])]
-            all_comments.append({"comment": c, "replies": replies})
+        resp = await _youtube_get(client, _COMMENTS_URL, params)
+        _raise_for_status(resp, "Error fetching replies")
+        data = orjson.loads(resp.content)
+        replies.extend(map(filter_comment, data.get("items", ())))
         token = data.get("nextPageToken")
         if not token:
             break
-    return all_comments
+    return replies
 
-async def fetch_top_comments(client: httpx.AsyncClient, video_id: str, limit: int = 100) -> list:
+async def fetch_top_comments(
+    client: httpx.AsyncClient, video_id: str, limit: int = 100, sentiment: str = "vader"
+) -> list:
     """
     Fetch up to `limit` top‐level comments sorted by relevance.
+
+    YouTube ranks server-side, so this is a single page (at most 100 threads)
+    with only the replies embedded in it: no pagination and no reply backfill.
     """
-    url = "https://www.googleapis.com/youtube/v3/commentThreads"
     params = {
-        "key": YOUTUBE_DATA_API_KEY,
-        "textFormat": "plainText",
-        "part": "snippet,replies",
+        **_COMMENT_THREAD_PARAMS,
         "videoId": video_id,
         "order": "relevance",      # built-in relevance ordering
-        "maxResults": min(limit, 100)
+        "maxResults": min(limit, 100),
     }
-    resp = await client.get(url, params=params)
-    if resp.status_code != 200:
-        raise HTTPException(status_code=resp.status_code, detail="Error fetching top comments")
-    items = resp.json().get("items", [])[:limit]
-    top_comments = []
-    for item in items:
-        top = item.get("snippet", {}).get("topLevelComment")
-        if not top:
-            continue
-        c = filter_comment(top)
-        replies = [filter_comment(r) for r in item.get("replies", {}).get("comments", [])]
-        top_comments.append({"comment": c, "replies": replies})
-    return top_comments
+    resp = await _youtube_get(client, _COMMENT_THREADS_URL, params)
+    _raise_for_status(resp, "Error fetching top comments")
+    items = orjson.loads(resp.content).get("items", [])[:limit]
+    top_comments = [t for t in map(_parse_thread, items) if t is not None]
+    return await attach_sentiments(top_comments, sentiment)